@@ -209,12 +209,18 @@ if st.session_state.client is not None:
         with st.status("AI Summary", expanded=True) as status_box_2:
             # Generate AI answer using the stored user_query from session state
             # Reuse the same config-managed API key to keep AI calls consistent with query generation
-            ai_answer = llm_utils.generate_ai_answer(
-                st.session_state.get("user_query", ""), 
-                st.session_state["results_df"], 
-                GOOGLE_LLM_API_KEY
-            )
-            st.write(ai_answer)
+            # Errors (e.g. no free LLM slot within the timeout) are shown instead of crashing the page
+            try:
+                ai_answer = llm_utils.generate_ai_answer(
+                    st.session_state.get("user_query", ""), 
+                    st.session_state["results_df"], 
+                    GOOGLE_LLM_API_KEY
+                )
+                st.write(ai_answer)
+            except Exception as e:
+                logger.error(f"Error generating AI summary: {str(e)}", exc_info=True)  # exc_info=True includes stack trace
+                st.error(f"❌ Error generating AI summary: {str(e)}")
+                ai_answer = None
             
             # Store ai_answer in session state so the callback function can access it
             # Callbacks execute before the main script reruns, so they need data from session state
@@ -239,7 +245,10 @@ if st.session_state.client is not None:
                     user_query = "" # make user_query empty so the user can ask a new question
                 else:
                     logger.info("User provided negative feedback")
-            selected = st.feedback("thumbs", key="feedback_widget", on_change=handle_feedback)
+            
+            # Only offer feedback when there is an AI summary to save alongside the query
+            if ai_answer is not None:
+                selected = st.feedback("thumbs", key="feedback_widget", on_change=handle_feedback)
 
 else:
     # If not connected, show message prompting user to fix credentials setup
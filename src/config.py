@@ -62,6 +62,11 @@ BIGQUERY_MAX_RESULTS = 1000       # Maximum rows to return (safety limit)
 BIGQUERY_PROJECT_ID = os.getenv("BIGQUERY_PROJECT_ID", "bigquery-public-data")
 BIGQUERY_DATASET = "goog_blockchain_ethereum_mainnet_us"
 
+# LLM CONCURRENCY LIMITER (adaptive limit shared by all Gemini calls in the process)
+LLM_MAX_CONCURRENCY = 16          # Upper bound for in-flight Gemini calls across all sessions
+LLM_CONCURRENCY_RECOVERY_SECONDS = 5.0  # Minimum spacing between concurrency adjustments
+LLM_SLOT_TIMEOUT_SECONDS = 60.0   # Maximum time a call waits for a free concurrency slot
+
 # FILE PATHS
 PROJECT_ROOT = Path(__file__).parent.parent
 
@@ -1,100 +1,110 @@
+import functools
 import json
 import logging
-from typing import Any
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
 
 import pandas as pd
-from langchain_core.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
+from google.api_core.exceptions import ResourceExhausted
 
-from config import FEWSHOT_FILE
+try:
+    # orjson is a Rust-backed JSON parser, several times faster than the stdlib json module
+    import orjson
+except ImportError:  # Optional speedup - fall back to the stdlib json module when missing
+    orjson = None
+
+from config import (
+    FEWSHOT_FILE,
+    LLM_MAX_CONCURRENCY,
+    LLM_CONCURRENCY_RECOVERY_SECONDS,
+    LLM_SLOT_TIMEOUT_SECONDS
+)
 
 # Create logger for llm_utils information
 logger = logging.getLogger(__name__)
 
+# INPUT LENGTH LIMITS (defined once at import, shared by every validation call)
+MAX_QUERY_LENGTH = 5000       # Maximum characters allowed in user query
+MAX_SCHEMA_LENGTH = 100000    # Maximum characters allowed in schema
+MAX_NAME_LENGTH = 500         # Maximum characters for saved query name
+MAX_SQL_LENGTH = 50000        # Maximum characters for saved SQL query
+MAX_NOTES_LENGTH = 5000       # Maximum characters for saved notes
 
-def generate_sql_query(
-    user_query: str, 
-    api_key: str, 
-    db_schema: str, 
-    few_shot_examples: str
-) -> str:
+
+def _json_loads(data: Any) -> Any:
     """
-    Simple LLM generation function using LangChain with prompt template.
+    Parse a JSON document (str or bytes) using orjson when installed, stdlib json otherwise.
     
-    Args:
-        user_query (str): The natural language input text from the user
-        api_key (str): Your Google AI API key for authentication
-        db_schema (str): The database schema definition (tables, columns, types)
-        few_shot_examples (str): JSON string containing example queries for context
-        
-    Returns:
-        str: Generated SQL query string from the LLM
-        
-    Raises:
-        ValueError: If any required parameter is None, empty, or invalid
-        json.JSONDecodeError: If few_shot_examples is not valid JSON
+    Both parsers raise a json.JSONDecodeError subclass on malformed input. Only use this for
+    read-only parses: orjson turns integers wider than 64 bits into floats, so data that is
+    written back must be read with the stdlib json module.
     """
-    # ========== INPUT VALIDATION ==========
-    # Validate that all required parameters are provided and not None
-    # This prevents cryptic errors later in the function execution
-    if user_query is None:
-        raise ValueError("user_query parameter cannot be None")
-    if api_key is None:
-        raise ValueError("api_key parameter cannot be None")
-    if db_schema is None:
-        raise ValueError("db_schema parameter cannot be None")
-    if few_shot_examples is None:
-        raise ValueError("few_shot_examples parameter cannot be None")
-    
-    # Validate that string parameters are not empty or just whitespace
-    # strip() removes leading/trailing whitespace, then we check if anything remains
-    if not user_query.strip():
-        raise ValueError("user_query cannot be empty or contain only whitespace")
-    if not api_key.strip():
-        raise ValueError("api_key cannot be empty or contain only whitespace")
-    if not db_schema.strip():
-        raise ValueError("db_schema cannot be empty or contain only whitespace")
-    if not few_shot_examples.strip():
-        raise ValueError("few_shot_examples cannot be empty or contain only whitespace")
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps_pretty(obj: Any) -> bytes:
+    """
+    Serialize obj to 4-space-indented UTF-8 JSON bytes with non-ASCII characters kept as-is.
     
-    # Validate that few_shot_examples is valid JSON
-    # This catches malformed JSON early before it causes issues in the prompt
-    try:
-        # Attempt to parse the JSON string to verify it's valid
-        json.loads(few_shot_examples)
-    except json.JSONDecodeError as e:
-        # If JSON parsing fails, raise a descriptive error with details
-        raise ValueError(f"few_shot_examples must be valid JSON string. Error: {str(e)}")
+    Always uses the stdlib json module: orjson only supports 2-space indentation, and
+    the few-shot file is committed with indent=4. Writes happen only on user feedback,
+    so the faster codec is reserved for the read-only validation path.
+    """
+    return json.dumps(obj, indent=4, ensure_ascii=False).encode("utf-8")
+
+
+@functools.cache
+def _load_langchain():
+    """
+    Import the LangChain classes on first use instead of at module import.
     
-    # Additional validation: Check that user_query has reasonable length
-    # Prevents excessively long queries that could cause performance issues
-    MAX_QUERY_LENGTH = 5000  # Maximum characters allowed in user query
-    if len(user_query) > MAX_QUERY_LENGTH:
-        raise ValueError(f"user_query exceeds maximum length of {MAX_QUERY_LENGTH} characters")
+    langchain_google_genai pulls in the google-generativeai + protobuf stack, which takes
+    seconds on a cold start. Deferring the import keeps app startup and LLM-free code
+    paths (e.g. save_successful_query) fast; the import cost is paid once, on the first
+    LLM call.
     
-    # Additional validation: Check that db_schema has reasonable length
-    MAX_SCHEMA_LENGTH = 100000  # Maximum characters allowed in schema
-    if len(db_schema) > MAX_SCHEMA_LENGTH:
-        raise ValueError(f"db_schema exceeds maximum length of {MAX_SCHEMA_LENGTH} characters")
+    Returns:
+        tuple: (ChatGoogleGenerativeAI, PromptTemplate) classes
+    """
+    from langchain_core.prompts import PromptTemplate
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI, PromptTemplate
+
+
+@functools.lru_cache(maxsize=8)
+def _get_llm(model: str, api_key: str, temperature: float = 0.5):
+    """
+    Return a ChatGoogleGenerativeAI instance cached per (model, api_key, temperature).
     
-    # Log successful validation for debugging and monitoring
-    logger.debug(f"Input validation passed for user_query: '{user_query[:50]}...'")
-    # ========== END INPUT VALIDATION ==========
+    The instance owns the Gemini client (auth state and the gRPC channel), so reusing it
+    skips client setup and the TLS handshake on every call after the first one.
     
-    # Create a new LLM instance for generating the SQL query
-    # Model: gemini-2.5-flash-lite - Fast and efficient for SQL generation
-    # Temperature: 0.5 - Balanced between deterministic and creative responses
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash-lite",
+    Args:
+        model (str): Gemini model name
+        api_key (str): Google AI API key for authentication
+        temperature (float): Sampling temperature
+    
+    Returns:
+        ChatGoogleGenerativeAI: LLM instance
+    """
+    ChatGoogleGenerativeAI, _ = _load_langchain()
+    return ChatGoogleGenerativeAI(
+        model=model,
         google_api_key=api_key,
-        temperature=0.5
+        temperature=temperature
     )
-    
-    # Create a prompt template string with placeholders for LangChain variables
-    # We use a raw string here (not an f-string) to avoid Python interpreting the curly braces
-    # LangChain's PromptTemplate will handle the variable substitution
-    # The curly braces {db_schema}, {few_shot_examples}, {user_query} are LangChain template variables
-    prompt = """
+
+
+# ============================================================================
+# PROMPT TEMPLATES - Literal template strings, compiled into PromptTemplate once
+# ============================================================================
+# Plain strings (not f-strings) so Python does not interpret the curly braces
+# {db_schema}, {few_shot_examples}, {user_query}, {results_df} are LangChain template variables
+_SQL_PROMPT = """
     You are a crypto data analyst. You have experience and knowledge in blockchain data analysis and you are expert in BigQuery SQL.
     You are given a database schema and a user query. You need to generate a SQL query that will answer the user query.
     The SQL query should be in BigQuery SQL syntax.
@@ -115,22 +125,345 @@ def generate_sql_query(
     Few shot examples: {few_shot_examples}
     User query: {user_query}
     """
+
+_ANSWER_PROMPT = """
+    You are a crypto data analyst. You have experience and domain knowledge in blockchain data analysis.
+    You are given a user query and a results dataframe. You need to summarize results take into account user query and results.
+    User query: {user_query}
+    Results: {results_df}
+    The answer should be in a natural language format. 
+    No introduction sentence.
+    Be specific and to the point.
+    Do not rewrite results, but summarize them in a natural language format. Add some insights and observations based on the results if possible.
+    If date was not specified in user query, assume the most recent date period that makes sense for the query and write in answer that date was not specified so latest date period was used.
+    """
+
+
+@functools.cache
+def _get_sql_prompt_template():
+    """
+    Build the SQL-generation PromptTemplate once and reuse it for every call.
+    
+    The template string is a constant, so variable discovery and validation only need
+    to run on the first call. Built lazily (not at import) to keep LangChain out of startup.
+    
+    Note: few_shot_examples is passed as a template *value*, so curly braces in its JSON
+    are not interpreted as template variables.
     
-    # Create a prompt template with placeholders for user input
-    # The {db_schema}, {few_shot_examples}, {user_query} will be replaced with actual values
-    # Note: few_shot_examples should have its curly braces escaped (done in app.py) 
-    # to prevent LangChain from interpreting JSON structure as template variables
-    prompt_template = PromptTemplate(
+    Returns:
+        PromptTemplate: Template with db_schema, few_shot_examples and user_query variables
+    """
+    _, PromptTemplate = _load_langchain()
+    return PromptTemplate(
         input_variables=["db_schema", "few_shot_examples", "user_query"],
-        template=prompt
+        template=_SQL_PROMPT
     )
+
+
+@functools.cache
+def _get_answer_prompt_template():
+    """
+    Build the results-summary PromptTemplate once and reuse it for every call.
+    
+    Returns:
+        PromptTemplate: Template with user_query and results_df variables
+    """
+    _, PromptTemplate = _load_langchain()
+    return PromptTemplate(
+        input_variables=["user_query", "results_df"],
+        template=_ANSWER_PROMPT
+    )
+
+
+class _AdaptiveConcurrencyLimiter:
+    """
+    Thread-safe AIMD (additive increase, multiplicative decrease) limiter for Gemini calls.
+    
+    Streamlit serves every user session on its own thread, so concurrent sessions call
+    Gemini in parallel. Bursting past the per-minute quota triggers 429 responses, and
+    the retries that follow dominate latency. This limiter keeps the number of in-flight
+    calls just under the quota: it halves the limit when Gemini rate-limits calls and
+    adds one slot back after a success. Each direction adjusts at most once per recovery
+    interval, so a burst of 429s from calls that were already in flight halves the limit
+    once instead of collapsing it to 1.
+    
+    Args:
+        max_limit (int): Upper bound for concurrent in-flight calls
+        recovery_interval (float): Minimum seconds between two adjustments in the same direction
+        slot_timeout (float): Maximum seconds a call waits for a free slot
+    """
+    
+    def __init__(self, max_limit: int, recovery_interval: float, slot_timeout: float):
+        self._max_limit = max_limit
+        self._limit = max_limit
+        self._in_flight = 0
+        self._recovery_interval = recovery_interval
+        self._slot_timeout = slot_timeout
+        self._last_adjustment = time.monotonic()
+        self._last_decrease = float("-inf")  # The first 429 always shrinks the limit
+        self._condition = threading.Condition()
+    
+    @contextmanager
+    def slot(self):
+        """
+        Wait for a free call slot and hold it for the duration of the with-block.
+        
+        Raises:
+            TimeoutError: If no slot frees up within slot_timeout seconds
+        """
+        with self._condition:
+            # Bounded wait so a hung Gemini call cannot block every session indefinitely
+            if not self._condition.wait_for(lambda: self._in_flight < self._limit, timeout=self._slot_timeout):
+                raise TimeoutError(
+                    f"Timed out after {self._slot_timeout:.0f}s waiting for a free LLM slot "
+                    f"({self._in_flight} Gemini calls in flight, limit {self._limit}). Please try again."
+                )
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify()
+    
+    def on_success(self) -> None:
+        """Additively grow the limit back towards max_limit after a successful call."""
+        with self._condition:
+            now = time.monotonic()
+            if self._limit < self._max_limit and now - self._last_adjustment >= self._recovery_interval:
+                self._limit += 1
+                self._last_adjustment = now
+                self._condition.notify()
+    
+    def on_rate_limited(self) -> None:
+        """Halve the limit after Gemini rejected a call with 429, once per recovery interval."""
+        with self._condition:
+            now = time.monotonic()
+            # Further 429s within the interval come from the same burst - already accounted for
+            if now - self._last_decrease < self._recovery_interval:
+                return
+            self._limit = max(1, self._limit // 2)
+            self._last_decrease = now
+            self._last_adjustment = now
+            logger.warning(f"Gemini rate limit hit, reducing LLM concurrency limit to {self._limit}")
+
+
+# Single limiter shared by every LLM call in the process
+_llm_limiter = _AdaptiveConcurrencyLimiter(
+    LLM_MAX_CONCURRENCY,
+    LLM_CONCURRENCY_RECOVERY_SECONDS,
+    LLM_SLOT_TIMEOUT_SECONDS
+)
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    """
+    Check whether an exception raised by a Gemini call is a 429 / quota error.
+    
+    google.api_core raises ResourceExhausted (code 429) on the gRPC transport and
+    langchain-google-genai may re-raise it wrapped, so the exception chain is walked.
+    The gRPC status name is matched as a fallback; bare "429" text is not, because
+    user data such as block numbers can contain those digits.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, ResourceExhausted) or getattr(error, "code", None) == 429:
+            return True
+        if "RESOURCE_EXHAUSTED" in str(error):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def _build_sql_chain(api_key: str) -> Any:
+    """
+    Build the default SQL-generation chain: prompt template piped into the cached LLM.
     
-    # Create a chain by combining prompt template and LLM using the pipe operator
-    # This means: prompt_template outputs formatted text → LLM processes it
-    chain = prompt_template | llm
+    generate_sql_query() accepts a chain_factory with this signature. A caller-supplied
+    factory replaces this function entirely, so callers (e.g. tests) can use a fake chain
+    without importing LangChain or building a Gemini client.
+    
+    Args:
+        api_key (str): Google AI API key for authentication
+    
+    Returns:
+        Runnable: prompt_template | llm
+    """
+    # Cached LLM instance (channel stays warm across calls)
+    # Model: gemini-2.5-flash-lite - Fast and efficient for SQL generation
+    # Temperature: 0.5 - Balanced between deterministic and creative responses
+    llm = _get_llm("gemini-2.5-flash-lite", api_key, temperature=0.5)
+    
+    # prompt_template outputs formatted text → LLM processes it
+    return _get_sql_prompt_template() | llm
+
+
+def _build_answer_chain(api_key: str) -> Any:
+    """
+    Build the default results-summary chain: prompt template piped into the cached LLM.
+    
+    generate_ai_answer() accepts a chain_factory with this signature (see _build_sql_chain).
+    
+    Args:
+        api_key (str): Google AI API key for authentication
+    
+    Returns:
+        Runnable: prompt_template | llm
+    """
+    # Model: gemini-2.5-flash-lite - Fast and efficient for text summarization
+    # Temperature: 0.5 - Balanced between deterministic and creative responses
+    llm = _get_llm("gemini-2.5-flash-lite", api_key, temperature=0.5)
+    return _get_answer_prompt_template() | llm
+
+
+def _invoke_chain(chain: Any, inputs: dict) -> Any:
+    """
+    Invoke a LangChain chain under the shared adaptive concurrency limiter.
+    
+    Args:
+        chain: Runnable produced by combining a prompt template with an LLM
+        inputs (dict): Template variables passed to chain.invoke()
+    
+    Returns:
+        The LLM response message
+    """
+    with _llm_limiter.slot():
+        try:
+            response = chain.invoke(inputs)
+        except Exception as e:
+            if _is_rate_limit_error(e):
+                _llm_limiter.on_rate_limited()
+            raise
+    _llm_limiter.on_success()
+    return response
+
+
+def _require_str(name: str, value: Any, max_length: Optional[int] = None) -> None:
+    """
+    Validate a required string parameter in a single call.
+    
+    The public functions drive this from a table of (parameter name, value, maximum length
+    or None) specs, checked in order, so the first invalid parameter in the table is the
+    one reported.
+    
+    Args:
+        name (str): Parameter name used in error messages
+        value: The value to validate
+        max_length (int, optional): Maximum allowed length in characters, None for no limit
+    
+    Raises:
+        ValueError: If value is None, empty/whitespace-only, or longer than max_length
+        TypeError: If value is not a string
+    """
+    if value is None:
+        raise ValueError(f"{name} parameter cannot be None")
+    if not isinstance(value, str):
+        raise TypeError(f"{name} must be a string, got {type(value).__name__}")
+    if not value.strip():
+        raise ValueError(f"{name} cannot be empty or contain only whitespace")
+    if max_length is not None and len(value) > max_length:
+        raise ValueError(f"{name} exceeds maximum length of {max_length} characters")
+
+
+def _require_dataframe(name: str, value: Any) -> None:
+    """
+    Validate a required, non-empty pandas DataFrame parameter.
+    
+    Args:
+        name (str): Parameter name used in error messages
+        value: The value to validate
+    
+    Raises:
+        ValueError: If value is None or an empty DataFrame
+        TypeError: If value is not a pandas DataFrame
+    """
+    if value is None:
+        raise ValueError(f"{name} parameter cannot be None")
+    if not isinstance(value, pd.DataFrame):
+        raise TypeError(f"{name} must be a pandas DataFrame, got {type(value).__name__}")
+    if value.empty:
+        raise ValueError(f"{name} cannot be an empty DataFrame")
+
+
+@functools.lru_cache(maxsize=32)
+def _validate_few_shot_json(few_shot_examples: str) -> None:
+    """
+    Check that few_shot_examples is valid JSON, memoized per distinct string.
+    
+    app.py passes the same few-shot file contents on every generate_sql_query call, so
+    the (potentially large) document is parsed once instead of on every LLM request.
+    Failed validations raise and are therefore never cached.
+    
+    Parsing uses orjson when installed, which is stricter than the stdlib json module:
+    NaN/Infinity literals and lone surrogate escapes (e.g. "\\ud800") are rejected, and
+    integers wider than 64 bits become floats. A few-shot file relying on any of these
+    passed validation before orjson was added and now fails (or loses precision).
+    
+    Args:
+        few_shot_examples (str): JSON string containing example queries
+    
+    Raises:
+        ValueError: If few_shot_examples is not valid JSON
+    """
+    try:
+        # Attempt to parse the JSON string to verify it's valid
+        _json_loads(few_shot_examples)
+    except json.JSONDecodeError as e:
+        # If JSON parsing fails, raise a descriptive error with details
+        raise ValueError(f"few_shot_examples must be valid JSON string. Error: {str(e)}")
+
+
+def generate_sql_query(
+    user_query: str, 
+    api_key: str, 
+    db_schema: str, 
+    few_shot_examples: str,
+    chain_factory: Optional[Callable[[str], Any]] = None
+) -> str:
+    """
+    Simple LLM generation function using LangChain with prompt template.
+    
+    Args:
+        user_query (str): The natural language input text from the user
+        api_key (str): Your Google AI API key for authentication
+        db_schema (str): The database schema definition (tables, columns, types)
+        few_shot_examples (str): JSON string containing example queries for context
+        chain_factory (callable, optional): Called with api_key, returns the runnable chain.
+            None builds the LangChain pipeline (_build_sql_chain); tests can inject a fake chain.
+        
+    Returns:
+        str: Generated SQL query string from the LLM
+        
+    Raises:
+        ValueError: If any required parameter is None, empty, too long, or not valid JSON
+        TypeError: If any parameter is not a string
+        TimeoutError: If no LLM concurrency slot frees up within LLM_SLOT_TIMEOUT_SECONDS
+    """
+    # ========== INPUT VALIDATION ==========
+    for name, value, max_length in (
+        ("user_query", user_query, MAX_QUERY_LENGTH),
+        ("api_key", api_key, None),
+        ("db_schema", db_schema, MAX_SCHEMA_LENGTH),
+        ("few_shot_examples", few_shot_examples, None),
+    ):
+        _require_str(name, value, max_length)
+    
+    # Validate that few_shot_examples is valid JSON
+    # This catches malformed JSON early before it causes issues in the prompt
+    # The result is memoized, so the same few-shot bundle is only parsed once
+    _validate_few_shot_json(few_shot_examples)
+    
+    # Log successful validation for debugging and monitoring
+    logger.debug(f"Input validation passed for user_query: '{user_query[:50]}...'")
+    # ========== END INPUT VALIDATION ==========
+    
+    # Create a chain combining the cached prompt template and LLM (unless a factory was injected)
+    chain = (chain_factory or _build_sql_chain)(api_key)
     
     # Execute the chain: format prompt with user_input, then generate response
-    response = chain.invoke({"db_schema": db_schema, "few_shot_examples": few_shot_examples, "user_query": user_query})
+    # Runs under the shared concurrency limiter so parallel sessions stay within Gemini's quota
+    response = _invoke_chain(chain, {"db_schema": db_schema, "few_shot_examples": few_shot_examples, "user_query": user_query})
 
     logger.info(f"Generated SQL query: {response}")
 
@@ -140,7 +473,8 @@ def generate_sql_query(
 def generate_ai_answer(
     user_query: str, 
     results_df: pd.DataFrame, 
-    api_key: str
+    api_key: str,
+    chain_factory: Optional[Callable[[str], Any]] = None
 ) -> str:
     """
     Generate an AI answer including user query and query results context.
@@ -149,79 +483,81 @@ def generate_ai_answer(
         user_query (str): The original natural language query from the user
         results_df (pd.DataFrame): The query results as a pandas DataFrame
         api_key (str): Your Google AI API key for authentication
+        chain_factory (callable, optional): Called with api_key, returns the runnable chain.
+            None builds the LangChain pipeline (_build_answer_chain)
     
     Returns:
         str: Natural language summary of the query results
         
     Raises:
         ValueError: If any required parameter is None, empty, or invalid
-        TypeError: If results_df is not a pandas DataFrame
+        TypeError: If results_df is not a pandas DataFrame or a string parameter is not a string
+        TimeoutError: If no LLM concurrency slot frees up within LLM_SLOT_TIMEOUT_SECONDS
     """
     # ========== INPUT VALIDATION ==========
-    # Validate that all required parameters are provided and not None
-    if user_query is None:
-        raise ValueError("user_query parameter cannot be None")
-    if results_df is None:
-        raise ValueError("results_df parameter cannot be None")
-    if api_key is None:
-        raise ValueError("api_key parameter cannot be None")
-    
-    # Validate that string parameters are not empty or just whitespace
-    if not user_query.strip():
-        raise ValueError("user_query cannot be empty or contain only whitespace")
-    if not api_key.strip():
-        raise ValueError("api_key cannot be empty or contain only whitespace")
-    
-    # Validate that results_df is actually a pandas DataFrame
-    # Using isinstance() to ensure type safety
-    if not isinstance(results_df, pd.DataFrame):
-        raise TypeError(f"results_df must be a pandas DataFrame, got {type(results_df).__name__}")
-    
-    # Validate that the DataFrame is not empty
-    # An empty DataFrame would not provide meaningful context for the AI
-    if results_df.empty:
-        raise ValueError("results_df cannot be an empty DataFrame")
+    for name, value, max_length in (
+        ("user_query", user_query, MAX_QUERY_LENGTH),
+        ("api_key", api_key, None),
+    ):
+        _require_str(name, value, max_length)
     
-    # Additional validation: Check that user_query has reasonable length
-    MAX_QUERY_LENGTH = 5000  # Maximum characters allowed in user query
-    if len(user_query) > MAX_QUERY_LENGTH:
-        raise ValueError(f"user_query exceeds maximum length of {MAX_QUERY_LENGTH} characters")
+    # An empty DataFrame would not provide meaningful context for the AI
+    _require_dataframe("results_df", results_df)
     
     # Log successful validation for debugging
     logger.debug(f"Input validation passed for generate_ai_answer function")
     # ========== END INPUT VALIDATION ==========
     
-    # Create a new LLM instance for generating the natural language answer
-    # Model: gemini-2.5-flash-lite - Fast and efficient for text summarization
-    # Temperature: 0.5 - Balanced between deterministic and creative responses
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash-lite",
-        google_api_key=api_key,
-        temperature=0.5
-    )
+    # Create a chain combining the cached prompt template and LLM (unless a factory was injected)
+    chain = (chain_factory or _build_answer_chain)(api_key)
     
-    prompt = """
-    You are a crypto data analyst. You have experience and domain knowledge in blockchain data analysis.
-    You are given a user query and a results dataframe. You need to summarize results take into account user query and results.
-    User query: {user_query}
-    Results: {results_df}
-    The answer should be in a natural language format. 
-    No introduction sentence.
-    Be specific and to the point.
-    Do not rewrite results, but summarize them in a natural language format. Add some insights and observations based on the results if possible.
-    If date was not specified in user query, assume the most recent date period that makes sense for the query and write in answer that date was not specified so latest date period was used.
-    """
+    response = _invoke_chain(chain, {"user_query": user_query, "results_df": results_df})
+    
+    return response.content
 
-    prompt_template = PromptTemplate(
-        input_variables=["user_query", "results_df"],
-        template=prompt
-    )
+# Serializes save_successful_query's load -> duplicate check -> write -> index update.
+# Streamlit runs feedback callbacks on per-session threads, so saves can overlap.
+_few_shot_lock = threading.RLock()
+
+# Cached query names of the few-shot examples file as (file signature, set of names),
+# None until the first save. The signature changes whenever FEWSHOT_FILE points to another
+# file or the file is modified (edited, checked out, or written by another worker process),
+# which forces a rebuild, so duplicate detection never trusts names from a stale file.
+_few_shot_name_index: Optional[tuple] = None
+
+
+def _few_shot_file_signature() -> tuple:
+    """
+    Cheaply identify the current few-shot file version with a single stat() call.
     
-    chain = prompt_template | llm
+    Returns:
+        tuple: (path, modification time in ns, size in bytes)
+    """
+    stat = FEWSHOT_FILE.stat()
+    return (FEWSHOT_FILE, stat.st_mtime_ns, stat.st_size)
+
+
+def _invalidate_few_shot_name_index() -> None:
+    """Drop the cached name index so the next save rebuilds it from the file."""
+    global _few_shot_name_index
+    with _few_shot_lock:
+        _few_shot_name_index = None
+
+
+def _load_few_shot_examples() -> list:
+    """
+    Read and parse the few-shot examples file from the centralized config path.
     
-    response = chain.invoke({"user_query": user_query, "results_df": results_df})
+    Uses the stdlib json module rather than _json_loads: the result is written back in full
+    by save_successful_query, and stdlib json round-trips what orjson would not (integers
+    wider than 64 bits, NaN/Infinity).
     
-    return response.content
+    Returns:
+        list: Few-shot example dictionaries
+    """
+    with FEWSHOT_FILE.open("r", encoding="utf-8") as file:
+        return json.load(file)
+
 
 def save_successful_query(
     query_name: str, 
@@ -243,87 +579,82 @@ def save_successful_query(
         
     Raises:
         ValueError: If any required parameter is None, empty, or invalid
-        TypeError: If expected_result is not a pandas DataFrame
+        TypeError: If expected_result is not a pandas DataFrame or a string parameter is not a string
     """
+    global _few_shot_name_index
+    
     # ========== INPUT VALIDATION ==========
-    # Validate that all required parameters are provided and not None
-    if query_name is None:
-        raise ValueError("query_name parameter cannot be None")
-    if query_sql is None:
-        raise ValueError("query_sql parameter cannot be None")
-    if expected_result is None:
-        raise ValueError("expected_result parameter cannot be None")
-    if notes is None:
-        raise ValueError("notes parameter cannot be None")
-    
-    # Validate that string parameters are not empty or just whitespace
-    if not query_name.strip():
-        raise ValueError("query_name cannot be empty or contain only whitespace")
-    if not query_sql.strip():
-        raise ValueError("query_sql cannot be empty or contain only whitespace")
-    if not notes.strip():
-        raise ValueError("notes cannot be empty or contain only whitespace")
-    
-    # Validate that expected_result is actually a pandas DataFrame
-    if not isinstance(expected_result, pd.DataFrame):
-        raise TypeError(f"expected_result must be a pandas DataFrame, got {type(expected_result).__name__}")
-    
-    # Validate that the DataFrame is not empty
+    for name, value, max_length in (
+        ("query_name", query_name, MAX_NAME_LENGTH),
+        ("query_sql", query_sql, MAX_SQL_LENGTH),
+        ("notes", notes, MAX_NOTES_LENGTH),
+    ):
+        _require_str(name, value, max_length)
+    
     # We need at least some data to save as an example
-    if expected_result.empty:
-        raise ValueError("expected_result cannot be an empty DataFrame")
+    _require_dataframe("expected_result", expected_result)
     
     # Validate that the DataFrame has at least one column
     # A DataFrame without columns wouldn't be a meaningful example
     if len(expected_result.columns) == 0:
         raise ValueError("expected_result must have at least one column")
     
-    # Additional validation: Check string lengths to prevent unreasonably large data
-    MAX_NAME_LENGTH = 500  # Maximum characters for query name
-    MAX_SQL_LENGTH = 50000  # Maximum characters for SQL query
-    MAX_NOTES_LENGTH = 5000  # Maximum characters for notes
-    
-    if len(query_name) > MAX_NAME_LENGTH:
-        raise ValueError(f"query_name exceeds maximum length of {MAX_NAME_LENGTH} characters")
-    if len(query_sql) > MAX_SQL_LENGTH:
-        raise ValueError(f"query_sql exceeds maximum length of {MAX_SQL_LENGTH} characters")
-    if len(notes) > MAX_NOTES_LENGTH:
-        raise ValueError(f"notes exceeds maximum length of {MAX_NOTES_LENGTH} characters")
-    
     # Log successful validation
     logger.debug(f"Input validation passed for save_successful_query: '{query_name}'")
     # ========== END INPUT VALIDATION ==========
     
     logger.info(f"Saving successful query: {query_name} to eth_mainnet_sql_fewshots.json file")
 
-    # load few shot examples from the centralized config path so every module reads the same source
-    with FEWSHOT_FILE.open("r", encoding="utf-8") as file:
-        few_shot_examples = json.load(file)
-    
-    # check if query already in examples
-    if any(example["query_name"] == query_name for example in few_shot_examples):
-        logger.info(f"Query {query_name} already exists in few shot examples. Skipping save.")
-        return  # Return early to prevent duplicate from being appended
-
     # Get column names as a list of strings
     columns = expected_result.columns.tolist()
     
     # Convert DataFrame rows to list of lists with native Python types
     rows = expected_result.head(5).astype(str).values.tolist()
     
-    # add new query to few shot examples
-    few_shot_examples.append({
-        "query_name": query_name,
-        "query_sql": query_sql,
-        "expected_result": {
-            "columns": columns, 
-            "rows": rows,
-            "notes": notes
-        }
-    })
-    
-    # save few shot examples to file with indentation for readability
-    with FEWSHOT_FILE.open("w", encoding="utf-8") as file:
-        json.dump(few_shot_examples, file, indent=4, ensure_ascii=False)
+    # One lock around load -> check -> write -> index update so concurrent saves cannot
+    # lose each other's writes or leave a name in the index that never reached the file
+    with _few_shot_lock:
+        # Build the name index on the first save, or rebuild it if the file changed since,
+        # reusing the same parse for appending
+        signature = _few_shot_file_signature()
+        few_shot_examples = None
+        if _few_shot_name_index is None or _few_shot_name_index[0] != signature:
+            few_shot_examples = _load_few_shot_examples()
+            _few_shot_name_index = (signature, {example["query_name"] for example in few_shot_examples})
+        name_index = _few_shot_name_index[1]
+        
+        # check if query already in examples using the cached name index
+        # Set membership is O(1); while the file is unchanged, duplicates return without reading it
+        if query_name in name_index:
+            logger.info(f"Query {query_name} already exists in few shot examples. Skipping save.")
+            return  # Return early to prevent duplicate from being appended
+        
+        # load few shot examples (unless the index build above already did)
+        if few_shot_examples is None:
+            few_shot_examples = _load_few_shot_examples()
+        
+        # add new query to few shot examples
+        few_shot_examples.append({
+            "query_name": query_name,
+            "query_sql": query_sql,
+            "expected_result": {
+                "columns": columns, 
+                "rows": rows,
+                "notes": notes
+            }
+        })
+        
+        # save few shot examples to file with indentation for readability
+        try:
+            with FEWSHOT_FILE.open("wb") as file:
+                file.write(_json_dumps_pretty(few_shot_examples))
+        except Exception:
+            # The file may be partially written - rebuild the index from disk on the next save
+            _invalidate_few_shot_name_index()
+            raise
+        
+        # Keep the name index in sync with the file we just wrote (including its new signature)
+        name_index.add(query_name)
+        _few_shot_name_index = (_few_shot_file_signature(), name_index)
     
     logger.info(f"Saved successful query: {query_name} to eth_mainnet_sql_fewshots.json file")
\ No newline at end of file
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The app runs as `streamlit run src/app.py`, so modules import each other from src/
+# (e.g. `from config import ...`). Put src/ on the path so tests import them the same way.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from google.api_core.exceptions import ResourceExhausted
+
+from utils import llm_utils
+
+
+class FakeClock:
+    """Manually advanced replacement for time.monotonic() inside llm_utils."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(llm_utils, "time", SimpleNamespace(monotonic=fake_clock.monotonic))
+    return fake_clock
+
+
+class TestAdaptiveConcurrencyLimiter:
+
+    def test_burst_of_rate_limits_halves_once_per_interval(self, clock):
+        limiter = llm_utils._AdaptiveConcurrencyLimiter(16, recovery_interval=5.0, slot_timeout=1.0)
+
+        for _ in range(16):
+            limiter.on_rate_limited()
+        assert limiter._limit == 8
+
+        clock.now += 4.9
+        limiter.on_rate_limited()
+        assert limiter._limit == 8
+
+        clock.now += 0.1
+        limiter.on_rate_limited()
+        assert limiter._limit == 4
+
+    def test_limit_never_drops_below_one(self, clock):
+        limiter = llm_utils._AdaptiveConcurrencyLimiter(2, recovery_interval=5.0, slot_timeout=1.0)
+
+        for _ in range(5):
+            limiter.on_rate_limited()
+            clock.now += 5.0
+        assert limiter._limit == 1
+
+    def test_success_recovers_one_slot_per_interval_up_to_max(self, clock):
+        limiter = llm_utils._AdaptiveConcurrencyLimiter(4, recovery_interval=5.0, slot_timeout=1.0)
+        limiter.on_rate_limited()
+        assert limiter._limit == 2
+
+        limiter.on_success()
+        assert limiter._limit == 2
+
+        clock.now += 5.0
+        limiter.on_success()
+        limiter.on_success()
+        assert limiter._limit == 3
+
+        for _ in range(3):
+            clock.now += 5.0
+            limiter.on_success()
+        assert limiter._limit == 4
+
+    def test_slot_times_out_when_limit_is_exhausted(self):
+        limiter = llm_utils._AdaptiveConcurrencyLimiter(1, recovery_interval=5.0, slot_timeout=0.05)
+
+        with limiter.slot():
+            with pytest.raises(TimeoutError, match="waiting for a free LLM slot"):
+                with limiter.slot():
+                    pass
+            assert limiter._in_flight == 1
+        assert limiter._in_flight == 0
+
+    def test_released_slot_wakes_a_waiting_call(self):
+        limiter = llm_utils._AdaptiveConcurrencyLimiter(1, recovery_interval=5.0, slot_timeout=5.0)
+        acquired = threading.Event()
+
+        def wait_for_slot():
+            with limiter.slot():
+                acquired.set()
+
+        with limiter.slot():
+            waiter = threading.Thread(target=wait_for_slot)
+            waiter.start()
+            assert not acquired.wait(0.05)
+        waiter.join(timeout=5.0)
+        assert acquired.is_set()
+
+
+class TestIsRateLimitError:
+
+    @pytest.mark.parametrize("error, expected", [
+        (ResourceExhausted("quota exceeded"), True),
+        (SimpleNamespace(code=429, __cause__=None, __context__=None), True),
+        (RuntimeError("429 RESOURCE_EXHAUSTED: quota exceeded"), True),
+        (ValueError("Invalid block 4290 in query"), False),
+        (RuntimeError("Internal error"), False),
+    ])
+    def test_detects_rate_limit_errors(self, error, expected):
+        assert llm_utils._is_rate_limit_error(error) is expected
+
+    def test_detects_wrapped_resource_exhausted(self):
+        try:
+            try:
+                raise ResourceExhausted("quota exceeded")
+            except ResourceExhausted as e:
+                raise RuntimeError("Error calling model") from e
+        except RuntimeError as wrapped:
+            assert llm_utils._is_rate_limit_error(wrapped)
+
+
+class TestSaveSuccessfulQuery:
+
+    @pytest.fixture
+    def fewshot_file(self, tmp_path, monkeypatch):
+        path = tmp_path / "fewshots.json"
+        path.write_text("[]", encoding="utf-8")
+        monkeypatch.setattr(llm_utils, "FEWSHOT_FILE", path)
+        monkeypatch.setattr(llm_utils, "_few_shot_name_index", None)
+        return path
+
+    @staticmethod
+    def _save(query_name):
+        llm_utils.save_successful_query(query_name, "SELECT 1", pd.DataFrame({"n": [1]}), "notes")
+
+    @staticmethod
+    def _names(path):
+        return [example["query_name"] for example in json.loads(path.read_text(encoding="utf-8"))]
+
+    def test_skips_duplicate_query(self, fewshot_file):
+        self._save("q1")
+        self._save("q1")
+        assert self._names(fewshot_file) == ["q1"]
+
+    def test_rebuilds_index_for_a_new_file(self, fewshot_file, tmp_path, monkeypatch):
+        self._save("q1")
+        other = tmp_path / "other.json"
+        other.write_text("[]", encoding="utf-8")
+        monkeypatch.setattr(llm_utils, "FEWSHOT_FILE", other)
+        self._save("q1")
+        assert self._names(other) == ["q1"]
+
+    def test_rebuilds_index_after_external_edit(self, fewshot_file):
+        self._save("q1")
+        fewshot_file.write_text("[]", encoding="utf-8")
+        os.utime(fewshot_file, ns=(0, 0))
+        self._save("q1")
+        assert self._names(fewshot_file) == ["q1"]
+
+    def test_concurrent_saves_keep_every_query(self, fewshot_file):
+        threads = [threading.Thread(target=self._save, args=(f"q{i}",)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(self._names(fewshot_file)) == sorted(f"q{i}" for i in range(8))
+
+    def test_rewrite_preserves_wide_integers_and_nan(self, fewshot_file):
+        fewshot_file.write_text('[{"query_name": "q0", "value": 123456789012345678901234567890, "ratio": NaN}]', encoding="utf-8")
+        self._save("q1")
+        saved = fewshot_file.read_text(encoding="utf-8")
+        assert "123456789012345678901234567890" in saved
+        assert "NaN" in saved